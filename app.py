@@ -2,7 +2,12 @@ import os
 import random
 import json
 import base64
-from datetime import datetime, timedelta
+import bisect
+import hmac
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from urllib.parse import urlencode
 
 from dotenv import load_dotenv
@@ -10,18 +15,32 @@ load_dotenv()
 
 from flask import (
     Flask, render_template, request,
-    redirect, url_for, flash, abort, jsonify
+    redirect, url_for, flash, abort, jsonify,
+    g, make_response, session
 )
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as _pg_insert
+from sqlalchemy.dialects.sqlite import insert as _sqlite_insert
+from sqlalchemy.orm import defer, joinedload, raiseload, selectinload
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter, Retry
 
 from email.mime.text import MIMEText
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request as GoogleRequest
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 # --------------------------------------------------
 # FLASK APP + DATABASE CONFIG
 # --------------------------------------------------
@@ -29,6 +48,18 @@ from google.auth.transport.requests import Request as GoogleRequest
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret")
 
+if orjson is not None:
+    # JSON encoding v C (orjson) za jsonify odgovore; stdlib json ostane
+    # fallback, če paketa ni
+    class _OrjsonProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = _OrjsonProvider(app)
+
 database_url = os.environ.get("DATABASE_URL")
 
 if database_url:
@@ -51,7 +82,41 @@ else:
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db = SQLAlchemy(app)
+_IS_SQLITE = app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+
+if _IS_SQLITE:
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_pre_ping": True,
+        "query_cache_size": 500,
+        "connect_args": {"check_same_thread": False, "timeout": 30},
+    }
+else:
+    # Postgres (Render): malo povezav zadošča, recikliramo pa jih preden
+    # jih strežnik sam poseka po idle timeoutu.
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_pre_ping": True,
+        "query_cache_size": 500,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_recycle": 1800,
+    }
+
+# expire_on_commit=False: write-then-render poti (redirect z objektom v roki)
+# po commitu ne sprožijo re-SELECT-a za vsak dostopan atribut
+db = SQLAlchemy(app, session_options={"expire_on_commit": False})
+
+if _IS_SQLITE:
+    # WAL: bralci ne blokirajo piscev, commiti so opazno cenejši.
+    with app.app_context():
+        @event.listens_for(db.engine, "connect")
+        def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute("PRAGMA temp_store=MEMORY")
+            cur.execute("PRAGMA mmap_size=134217728")
+            cur.execute("PRAGMA cache_size=-20000")
+            cur.close()
 
 
 # --------------------------------------------------
@@ -83,6 +148,8 @@ class Person(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=True)
+    # predizračunano "Ime Priimek" — da ga ne sestavljamo ob vsakem requestu
+    display_name = db.Column(db.String(200), nullable=True)
     email = db.Column(db.String(200), nullable=True)
     default_coffee_type_id = db.Column(db.Integer, db.ForeignKey("coffee_types.id"))
     is_present = db.Column(db.Boolean, default=True)
@@ -91,6 +158,11 @@ class Person(db.Model):
     default_coffee_type = db.relationship("CoffeeType", back_populates="people")
     selections = db.relationship("Selection", back_populates="person")
 
+    __table_args__ = (
+        db.Index("ix_people_active_present", "active", "is_present"),
+        db.Index("ix_people_default_coffee_type_id", "default_coffee_type_id"),
+    )
+
 
 class Selection(db.Model):
     __tablename__ = "selections"
@@ -104,6 +176,13 @@ class Selection(db.Model):
 
     person = db.relationship("Person", back_populates="selections")
 
+    __table_args__ = (
+        db.Index("ix_selections_selected_at", selected_at.desc()),
+        # pokriva stats agregacijo (filter source='auto', group by person_id,
+        # max(selected_at)) in s prefiksom tudi lookupe po person_id
+        db.Index("ix_selections_person_source_time", person_id, source, selected_at.desc()),
+    )
+
 
 class Setting(db.Model):
     __tablename__ = "settings"
@@ -111,14 +190,55 @@ class Setting(db.Model):
     value = db.Column(db.Text, nullable=True)
 
 # --------------------------------------------------
-# DB INIT — ALWAYS RUNS ON START (Render needs this!)
+# DB INIT — privzeto ob startu (Render), izklopljivo z AUTO_INIT_DB=0
 # --------------------------------------------------
-with app.app_context():
+def _init_db():
+    db.create_all()
+    # create_all preskoči že obstoječe tabele, zato indekse za stare baze
+    # dodamo še eksplicitno (idempotentno).
+    with db.engine.begin() as conn:
+        conn.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_people_active_present ON people (active, is_present)"
+        ))
+        conn.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_people_default_coffee_type_id"
+            " ON people (default_coffee_type_id)"
+        ))
+        conn.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_selections_selected_at ON selections (selected_at DESC)"
+        ))
+        conn.execute(db.text("DROP INDEX IF EXISTS ix_selections_person_id"))
+        conn.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_selections_person_source_time"
+            " ON selections (person_id, source, selected_at DESC)"
+        ))
+    # stolpec display_name za stare baze (ALTER ne pozna IF NOT EXISTS na sqlite)
     try:
-        db.create_all()
-        print("✓ Database initialized (create_all executed).")
-    except Exception as e:
-        print("DB INIT FAILED:", e)
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE people ADD COLUMN display_name VARCHAR(200)"))
+    except Exception:
+        pass  # stolpec že obstaja
+    with db.engine.begin() as conn:
+        conn.execute(db.text(
+            "UPDATE people SET display_name = TRIM(first_name || ' ' || COALESCE(last_name, ''))"
+            " WHERE display_name IS NULL"
+        ))
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Ustvari tabele in indekse (za lokalni dev / release task)."""
+    _init_db()
+    print("✓ Database initialized.")
+
+
+if os.environ.get("AUTO_INIT_DB", "1") == "1":
+    with app.app_context():
+        try:
+            _init_db()
+            logger.info("Database initialized (create_all executed).")
+        except Exception:
+            logger.exception("DB INIT FAILED")
 
 
 # --------------------------------------------------
@@ -130,20 +250,40 @@ GMAIL_REFRESH_TOKEN_ENV = os.environ.get("GMAIL_REFRESH_TOKEN")
 # --------------------------------------------------
 # SETTINGS HELPERJI
 # --------------------------------------------------
+# Settings se spreminjajo samo prek set_setting, zato jih lahko cachiramo
+# in-process — branje na hot pathu (gmail_token, automation_enabled) je
+# potem dict lookup namesto SELECT-a. RLock zaradi threaded gunicorn workerjev.
+_SETTINGS_CACHE: dict[str, str | None] = {}
+_SETTINGS_LOCK = threading.RLock()
+
+
 def get_setting(key: str) -> str | None:
-    row = Setting.query.get(key)
-    return row.value if row else None
+    with _SETTINGS_LOCK:
+        if key in _SETTINGS_CACHE:
+            return _SETTINGS_CACHE[key]
+
+    row = db.session.get(Setting, key)
+    value = row.value if row else None
+
+    with _SETTINGS_LOCK:
+        _SETTINGS_CACHE[key] = value
+    return value
 
 
 def set_setting(key: str, value: str | None):
-    row = Setting.query.get(key)
-    if not row:
-        row = Setting(key=key, value=value)
-        db.session.add(row)
-    else:
-        row.value = value
+    # En UPSERT namesto SELECT + INSERT/UPDATE para (in brez race-a med njima)
+    insert_fn = _sqlite_insert if _IS_SQLITE else _pg_insert
+    stmt = (
+        insert_fn(Setting)
+        .values(key=key, value=value)
+        .on_conflict_do_update(index_elements=[Setting.key], set_={"value": value})
+    )
+    db.session.execute(stmt)
     db.session.commit()
 
+    with _SETTINGS_LOCK:
+        _SETTINGS_CACHE[key] = value
+
 
 def is_automation_enabled() -> bool:
     return get_setting("automation_enabled") == "1"
@@ -152,13 +292,21 @@ def is_automation_enabled() -> bool:
 # --------------------------------------------------
 # GMAIL CREDENTIALS – SHRANJEVANJE / BRANJE
 # --------------------------------------------------
+# In-process cache: Credentials + zgrajen Gmail service, keyed po surovem
+# token JSON-u, da se json.loads + build() ne ponavljata na vsak send.
+_GMAIL_CACHE = {"token_json": None, "creds": None, "service": None}
+_GMAIL_ENV_TOKEN_KEY = "__env__"
+
+
 def _get_gmail_credentials() -> Credentials | None:
     token_json = get_setting("gmail_token")
 
     # 1) Če imamo token v bazi → super
     if token_json:
+        if _GMAIL_CACHE["token_json"] == token_json:
+            return _GMAIL_CACHE["creds"]
         data = json.loads(token_json)
-        return Credentials(
+        creds = Credentials(
             token=data["token"],
             refresh_token=data.get("refresh_token") or GMAIL_REFRESH_TOKEN_ENV,
             token_uri=data["token_uri"],
@@ -166,10 +314,14 @@ def _get_gmail_credentials() -> Credentials | None:
             client_secret=data["client_secret"],
             scopes=data["scopes"],
         )
+        _GMAIL_CACHE.update(token_json=token_json, creds=creds, service=None)
+        return creds
 
     # 2) Če nimamo pa imamo REFRESH TOKEN iz env → ustvarimo minimalne creds
     if GMAIL_REFRESH_TOKEN_ENV:
-        return Credentials(
+        if _GMAIL_CACHE["token_json"] == _GMAIL_ENV_TOKEN_KEY:
+            return _GMAIL_CACHE["creds"]
+        creds = Credentials(
             token=None,
             refresh_token=GMAIL_REFRESH_TOKEN_ENV,
             token_uri="https://oauth2.googleapis.com/token",
@@ -177,9 +329,25 @@ def _get_gmail_credentials() -> Credentials | None:
             client_secret=GMAIL_CLIENT_SECRET,
             scopes=GMAIL_SCOPES,
         )
+        _GMAIL_CACHE.update(token_json=_GMAIL_ENV_TOKEN_KEY, creds=creds, service=None)
+        return creds
 
+    _GMAIL_CACHE.update(token_json=None, creds=None, service=None)
     return None
 
+
+def _get_gmail_service(creds: Credentials):
+    """Vrne cachiran Gmail service; build() gre na omrežje le ob prvi uporabi."""
+    if _GMAIL_CACHE["service"] is None or _GMAIL_CACHE["creds"] is not creds:
+        _GMAIL_CACHE["service"] = build(
+            "gmail", "v1",
+            credentials=creds,
+            cache_discovery=False,
+            static_discovery=True,
+        )
+        _GMAIL_CACHE["creds"] = creds
+    return _GMAIL_CACHE["service"]
+
 # --------------------------------------------------
 # ENSURE VALID GMAIL CREDENTIALS OB ZAGONU
 # --------------------------------------------------
@@ -192,9 +360,32 @@ def _ensure_valid_gmail_credentials():
         try:
             creds.refresh(GoogleRequest())
             _save_gmail_credentials(creds)
-            print("✓ Gmail token refreshed ob zagonu.")
-        except Exception as e:
-            print("Gmail refresh error ob zagonu:", e)
+            logger.info("Gmail token refreshed ob zagonu.")
+        except Exception:
+            logger.exception("Gmail refresh error ob zagonu")
+
+def _refresh_gmail_token_if_needed(window: timedelta = timedelta(minutes=5)):
+    """Proaktivno osveži Gmail token, če bo potekel v naslednjih `window` minutah.
+
+    Kliče se ob periodičnih cron tickih (/run-auto), da refresh round-trip
+    ne pade v user-facing pošiljanje; inline refresh v send_email ostane
+    kot fallback.
+    """
+    creds = _get_gmail_credentials()
+    if not creds:
+        return
+
+    expiry = getattr(creds, "expiry", None)
+    if creds.token and expiry and expiry - datetime.utcnow() > window:
+        return
+
+    try:
+        creds.refresh(GoogleRequest())
+        _save_gmail_credentials(creds)
+        logger.info("Gmail token proaktivno osvežen.")
+    except Exception:
+        logger.exception("Gmail proaktivni refresh error")
+
 
 def _save_gmail_credentials(creds: Credentials):
     data = {
@@ -217,11 +408,20 @@ with app.app_context():
 # --------------------------------------------------
 # GMAIL OAUTH – URL, CALLBACK, DISCONNECT
 # --------------------------------------------------
-def _build_gmail_auth_url() -> str:
-    if not GMAIL_CLIENT_ID or not GMAIL_REDIRECT_URI:
-        raise RuntimeError("GMAIL_CLIENT_ID ali GMAIL_REDIRECT_URI nista nastavljena v environmentu.")
-
-    params = {
+# Skupen HTTP session s connection poolom — TLS handshake do Googla se
+# plača enkrat, ne ob vsakem OAuth klicu.
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+
+
+# Vsi parametri auth URL-ja so konstante iz env-a → URL sestavimo enkrat
+# ob importu (constant folding), route ga samo vrne.
+_GMAIL_AUTH_URL = (
+    "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode({
         "client_id": GMAIL_CLIENT_ID,
         "redirect_uri": GMAIL_REDIRECT_URI,
         "response_type": "code",
@@ -229,8 +429,16 @@ def _build_gmail_auth_url() -> str:
         "access_type": "offline",
         "include_granted_scopes": "true",
         "prompt": "consent",
-    }
-    return "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode(params)
+    })
+    if GMAIL_CLIENT_ID and GMAIL_REDIRECT_URI
+    else None
+)
+
+
+def _build_gmail_auth_url() -> str:
+    if not _GMAIL_AUTH_URL:
+        raise RuntimeError("GMAIL_CLIENT_ID ali GMAIL_REDIRECT_URI nista nastavljena v environmentu.")
+    return _GMAIL_AUTH_URL
 
 
 @app.route("/authorize-gmail")
@@ -268,7 +476,7 @@ def oauth2callback():
         "grant_type": "authorization_code",
     }
 
-    resp = requests.post(token_endpoint, data=data)
+    resp = _HTTP.post(token_endpoint, data=data, timeout=(3, 10))
     if resp.status_code != 200:
         flash(f"Napaka pri pridobivanju tokena: {resp.text}", "danger")
         return redirect(url_for("index"))
@@ -290,6 +498,7 @@ def oauth2callback():
         scopes=GMAIL_SCOPES,
     )
     _save_gmail_credentials(creds)
+    _bump_page_rev()
 
     flash("Gmail povezava uspešno vzpostavljena. ✅", "success")
     return redirect(url_for("index"))
@@ -308,6 +517,7 @@ def gmail_status():
 @app.route("/gmail/disconnect", methods=["POST"])
 def gmail_disconnect():
     set_setting("gmail_token", None)
+    _bump_page_rev()
     flash("Gmail povezava je bila odstranjena.", "info")
     return redirect(url_for("index"))
 
@@ -315,10 +525,22 @@ def gmail_disconnect():
 # --------------------------------------------------
 # POŠILJANJE EMAILA PREKO GMAIL API
 # --------------------------------------------------
+_EMAIL_POOL = ThreadPoolExecutor(max_workers=2)
+
+
+def send_email_async(to_email: str, subject: str, body: str):
+    """Odda pošiljanje v background thread — HTTP request ne čaka na Gmail API."""
+    def _task():
+        with app.app_context():
+            send_email(to_email, subject, body)
+
+    _EMAIL_POOL.submit(_task)
+
+
 def send_email(to_email: str, subject: str, body: str) -> bool:
     creds = _get_gmail_credentials()
     if not creds:
-        print("Gmail ni povezan, e-mail se ne pošlje.")
+        logger.warning("Gmail ni povezan, e-mail se ne pošlje.")
         return False
 
     # 🔥 Avtomatski refresh
@@ -326,12 +548,12 @@ def send_email(to_email: str, subject: str, body: str) -> bool:
         try:
             creds.refresh(GoogleRequest())
             _save_gmail_credentials(creds)
-        except Exception as e:
-            print("Ne morem osvežiti Gmail tokena:", e)
+        except Exception:
+            logger.exception("Ne morem osvežiti Gmail tokena")
             return False
 
     try:
-        service = build("gmail", "v1", credentials=creds)
+        service = _get_gmail_service(creds)
         msg = MIMEText(body, _charset="utf-8")
         msg["to"] = to_email
         msg["subject"] = subject
@@ -340,69 +562,95 @@ def send_email(to_email: str, subject: str, body: str) -> bool:
         message = {"raw": raw}
 
         service.users().messages().send(userId="me", body=message).execute()
-        print(f"Email poslan na {to_email}")
+        logger.info("Email poslan na %s", to_email)
         return True
-    except Exception as e:
-        print("Napaka pri pošiljanju e-maila:", e)
+    except Exception:
+        logger.exception("Napaka pri pošiljanju e-maila")
         return False
 
 
 # --------------------------------------------------
 # EMAIL VSEBINA – GLEDE NA SLOT
 # --------------------------------------------------
-def build_email_content(sel: Selection, slot: str) -> tuple[str, str]:
-    """Vrne (subject, body) glede na izbran termin in izbranega dežurnega."""
-    now = datetime.now()
+# Template stringi so konstante na nivoju modula — pri vsakem klicu se
+# interpolirajo samo spremenljiva polja.
+@lru_cache(maxsize=8)
+def _next_working_day(ordinal: int) -> date:
+    """Prvi delovni dan (pon–pet) strogo po dnevu z danim ordinalom.
+
+    Čista funkcija dneva, zato je memoizirana — weekend-skip zanka se za
+    isti dan izračuna samo enkrat.
+    """
+    d = date.fromordinal(ordinal) + timedelta(days=1)
+    while d.weekday() >= 5:  # 5 = sobota, 6 = nedelja
+        d += timedelta(days=1)
+    return d
 
-    if slot == "morning":
-        # naslednji žreb po jutranjem terminu je danes 13:15
-        next_dt = now.replace(hour=13, minute=15, second=0, microsecond=0)
-        next_label = "13:15"
-        next_date_str = next_dt.strftime("%d.%m.%Y")
 
-        body = f"""Pozdravljeni,
+_MORNING_SUBJECT = "Dežurni za jutranji termin"
+_MORNING_BODY_TMPL = """Pozdravljeni,
 
 Za jutranji termin (8:30) je dežurni:
-- {sel.person.first_name} {sel.person.last_name}.
+- {name}.
 
-Naslednji žreb bo {next_date_str} ob {next_label}.
+Naslednji žreb bo {next_date} ob {next_label}.
 
 Lep pozdrav,
 Sistem za dežurstvo kuhanja kave ☕"""
-        subject = "Dežurni za jutranji termin"
 
-    elif slot == "afternoon":
-        # naslednji žreb po popoldanskem terminu je naslednji delovni dan ob 8:15
-        next_dt = now + timedelta(days=1)
-        while next_dt.weekday() >= 5:  # 5 = sobota, 6 = nedelja
-            next_dt += timedelta(days=1)
-        next_dt = next_dt.replace(hour=8, minute=15, second=0, microsecond=0)
-        next_label = "08:15"
-        next_date_str = next_dt.strftime("%d.%m.%Y")
-
-        body = f"""Pozdravljeni,
+_AFTERNOON_SUBJECT = "Dežurni za popoldanski termin"
+_AFTERNOON_BODY_TMPL = """Pozdravljeni,
 
 Za popoldanski termin (13:30) je dežurni:
-- {sel.person.first_name} {sel.person.last_name}.
+- {name}.
 
-Naslednji žreb bo {next_date_str} ob {next_label}.
+Naslednji žreb bo {next_date} ob {next_label}.
 
 Lep pozdrav,
 Sistem za dežurstvo kuhanja kave ☕"""
-        subject = "Dežurni za popoldanski termin"
 
-    else:
-        # fallback za manual
-        body = f"""Pozdravljeni,
+_MANUAL_SUBJECT = "Dežurni za kavo"
+_MANUAL_BODY_TMPL = """Pozdravljeni,
 
 Dežurni za kuhanje kave je:
-- {sel.person.first_name} {sel.person.last_name}.
+- {name}.
 
 Lep pozdrav,
 Sistem za dežurstvo kuhanja kave ☕"""
-        subject = "Dežurni za kavo"
 
-    return subject, body
+
+def build_email_content(person, slot: str) -> tuple[str, str]:
+    """Vrne (subject, body) glede na izbran termin in izbranega dežurnega.
+
+    `person` je lahko Person ali lahka stats vrstica — rabi samo
+    display_name/first_name/last_name atribute.
+    """
+    now = datetime.now()
+    name = person.display_name or f"{person.first_name} {person.last_name or ''}".strip()
+
+    if slot == "morning":
+        # naslednji žreb po jutranjem terminu je danes 13:15
+        next_dt = now.replace(hour=13, minute=15, second=0, microsecond=0)
+        body = _MORNING_BODY_TMPL.format(
+            name=name,
+            next_date=next_dt.strftime("%d.%m.%Y"),
+            next_label="13:15",
+        )
+        return _MORNING_SUBJECT, body
+
+    if slot == "afternoon":
+        # naslednji žreb po popoldanskem terminu je naslednji delovni dan ob 8:15
+        next_day = _next_working_day(now.toordinal())
+        next_dt = datetime(next_day.year, next_day.month, next_day.day, 8, 15)
+        body = _AFTERNOON_BODY_TMPL.format(
+            name=name,
+            next_date=next_dt.strftime("%d.%m.%Y"),
+            next_label="08:15",
+        )
+        return _AFTERNOON_SUBJECT, body
+
+    # fallback za manual
+    return _MANUAL_SUBJECT, _MANUAL_BODY_TMPL.format(name=name)
 
 
 # --------------------------------------------------
@@ -414,28 +662,27 @@ def compute_next_auto_run_dynamic() -> datetime | None:
     Žreb je planiran za 8:15 in 13:15, od pon–pet.
     """
     now = datetime.now()
+    # rezultat je čista funkcija (dan, ura, minuta) → memoizirano spodaj
+    return _next_auto_run_for(now.toordinal(), now.hour, now.minute)
 
-    # Če je vikend, iščemo najbližji ponedeljek
-    if now.weekday() >= 5:  # 5 = sobota, 6 = nedelja
-        days_to_mon = (7 - now.weekday()) % 7
-        if days_to_mon == 0:
-            days_to_mon = 1
-        base = now + timedelta(days=days_to_mon)
-        return base.replace(hour=8, minute=15, second=0, microsecond=0)
 
-    today_morning = now.replace(hour=8, minute=15, second=0, microsecond=0)
-    today_afternoon = now.replace(hour=13, minute=15, second=0, microsecond=0)
+@lru_cache(maxsize=64)
+def _next_auto_run_for(ordinal: int, hour: int, minute: int) -> datetime:
+    day = date.fromordinal(ordinal)
+
+    # Če je vikend, iščemo najbližji ponedeljek
+    if day.weekday() >= 5:  # 5 = sobota, 6 = nedelja
+        next_day = _next_working_day(ordinal)
+        return datetime(next_day.year, next_day.month, next_day.day, 8, 15)
 
-    if now < today_morning:
-        return today_morning
-    if now < today_afternoon:
-        return today_afternoon
+    if (hour, minute) < (8, 15):
+        return datetime(day.year, day.month, day.day, 8, 15)
+    if (hour, minute) < (13, 15):
+        return datetime(day.year, day.month, day.day, 13, 15)
 
-    # danes smo že po 13:15 → jutri ob 8:15 (preskočimo vikend)
-    next_day = now + timedelta(days=1)
-    while next_day.weekday() >= 5:
-        next_day += timedelta(days=1)
-    return next_day.replace(hour=8, minute=15, second=0, microsecond=0)
+    # danes smo že po 13:15 → naslednji delovni dan ob 8:15
+    next_day = _next_working_day(ordinal)
+    return datetime(next_day.year, next_day.month, next_day.day, 8, 15)
 
 # --------------------------------------------------
 # STATISTIKA OSEB + UTEŽI (SAMO AUTO IZBIRE!)
@@ -444,7 +691,7 @@ def compute_person_stats(only_present: bool = False):
     """
     Vrne listo slovarjev za vsako osebo:
     {
-      "person": Person,
+      "person": vrstica (id, display_name, first_name, last_name, email),
       "name": "Ime Priimek",
       "total": št_auto_dežurstev,
       "last_date": datetime ali None,
@@ -455,43 +702,46 @@ def compute_person_stats(only_present: bool = False):
     """
     now = datetime.now()
 
-    query = Person.query.filter_by(active=True)
+    # En sam agregatni query (LEFT JOIN + GROUP BY) namesto dveh queryjev
+    # na osebo — štejemo samo AUTO izbire. Samo stolpci, ki jih stats
+    # dejansko rabijo — brez hidracije celih Person objektov.
+    query = (
+        db.session.query(
+            Person.id,
+            Person.display_name,
+            Person.first_name,
+            Person.last_name,
+            Person.email,
+            db.func.count(Selection.id).label("total"),
+            db.func.max(Selection.selected_at).label("last_dt"),
+        )
+        .outerjoin(
+            Selection,
+            db.and_(Selection.person_id == Person.id, Selection.source == "auto"),
+        )
+        .filter(Person.active.is_(True))
+        .group_by(Person.id)
+    )
     if only_present:
-        query = query.filter_by(is_present=True)
+        query = query.filter(Person.is_present.is_(True))
 
-    persons = query.all()
     stats = []
 
-    for p in persons:
-
-        # ŠTEJEMO SAMO AUTO IZBIRE
-        total = (
-            Selection.query
-            .filter_by(person_id=p.id, source="auto")
-            .count()
-        )
-
-        last_sel = (
-            Selection.query
-            .filter_by(person_id=p.id, source="auto")
-            .order_by(Selection.selected_at.desc())
-            .first()
-        )
+    for p in query.all():
+        total, last_dt = p.total, p.last_dt
 
-        if last_sel:
-            days = (now - last_sel.selected_at).days
-            last_dt = last_sel.selected_at
+        if last_dt:
+            days = (now - last_dt).days
         else:
             # Nikoli izbran v AUTO — daj velik push
             days = 10
-            last_dt = None
 
         # Formula za poštene uteži:
         weight = (days + 1) / (total + 1)
 
         stats.append({
             "person": p,
-            "name": f"{p.first_name} {p.last_name or ''}".strip(),
+            "name": p.display_name or f"{p.first_name} {p.last_name or ''}".strip(),
             "total": total,
             "last_date": last_dt,
             "days_since": days if last_dt else 0,
@@ -510,55 +760,118 @@ def compute_person_stats(only_present: bool = False):
     return stats
 
 
+# Statement za seznam tipov kave, zgrajen enkrat — trije viewi ga izvajajo
+# na vsak render in SQLAlchemy compiled cache ga zadane po identiteti.
+_STMT_COFFEE_TYPES_BY_NAME = db.select(CoffeeType).order_by(CoffeeType.name)
+
+
+def _coffee_types_by_name() -> list["CoffeeType"]:
+    return db.session.scalars(_STMT_COFFEE_TYPES_BY_NAME).all()
+
+
+# Cache prisotnih oseb za /random — roster se spreminja redko, klika se pogosto.
+# Invalidirajo ga vse mutacije rosterja (add/edit/delete/presence).
+_PRESENT_CACHE: dict[str, list[tuple[int, str]] | None] = {"rows": None}
+_PRESENT_LOCK = threading.RLock()
+
+
+def _present_people() -> list[tuple[int, str]]:
+    """Vrne [(id, display_name), ...] prisotnih aktivnih oseb iz cacha."""
+    with _PRESENT_LOCK:
+        rows = _PRESENT_CACHE["rows"]
+        if rows is None:
+            rows = [
+                (pid, name or first)
+                for pid, name, first in db.session.query(
+                    Person.id, Person.display_name, Person.first_name
+                )
+                .filter_by(is_present=True, active=True)
+                .all()
+            ]
+            _PRESENT_CACHE["rows"] = rows
+        return rows
+
+
+def _invalidate_present_cache():
+    with _PRESENT_LOCK:
+        _PRESENT_CACHE["rows"] = None
+
+
+def _lazyload_guard():
+    """V debug načinu spremeni pozabljen lazy-load v glasen error namesto
+    tihega N+1; v produkciji ne doda ničesar."""
+    return (raiseload("*"),) if app.debug else ()
+
+
+def _insert_selection(person_id: int, source: str, slot: str | None, **extra) -> int:
+    """Zapiše eno Selection vrstico s Core INSERT-om in vrne njen id.
+
+    Skupna pot za /random in auto žreb — preskoči unit-of-work flush,
+    selected_at pride iz column defaulta.
+    """
+    result = db.session.execute(
+        Selection.__table__.insert().values(
+            person_id=person_id, source=source, slot=slot, **extra
+        )
+    )
+    db.session.commit()
+    return result.inserted_primary_key[0]
+
+
 # --------------------------------------------------
 # DEJANSKI AUTO ŽREB (funkcija, ki jo kliče CRON)
 # --------------------------------------------------
-def run_auto_selection():
+def run_auto_selection(slot: str):
     """
     Vrne (True, msg) če uspe.
     Vrne (False, msg) če ne uspe.
-    """
-    now = datetime.now()
 
-    # Žreb dovoljen le ob 8:15 in 13:15 (±1 min tolerance)
-    allowed = [
-        (8, 15),
-        (13, 15)
-    ]
-    if (now.hour, now.minute) not in allowed:
-        return False, "Ni pravi čas za avtomatski žreb."
-
-    # Najde prisotne osebe
-    present_people = Person.query.filter_by(is_present=True, active=True).all()
-    if not present_people:
-        return False, "Ni prisotnih oseb."
+    Timing določa klicatelj (cron poda slot) — strogi ±1 min check je
+    zavračal legitimne ticke, če je cron zamujal minuto.
+    """
+    if slot not in ("morning", "afternoon"):
+        return False, "Neveljaven slot (pričakujem morning/afternoon)."
 
-    # Statistika z utežmi
+    # Statistika z utežmi (vključuje že filter prisotnih — poseben
+    # pre-query za prisotnost bi bil podvojen SELECT)
     stats = compute_person_stats(only_present=True)
 
     if not stats:
-        return False, "Ni ljudi v statistiki."
-
-    # Izbira po utežeh
-    weights = [s["weight"] for s in stats]
-    persons = [s["person"] for s in stats]
+        return False, "Ni prisotnih oseb."
 
-    chosen = random.choices(persons, weights=weights, k=1)[0]
+    # Izbira po utežeh — CDF zgradimo v enem prehodu, izbor je bisect po njem
+    cdf = list(itertools.accumulate(s["weight"] for s in stats))
+    idx = bisect.bisect(cdf, random.random() * cdf[-1])
+    chosen = stats[min(idx, len(stats) - 1)]["person"]
 
-    sel = Selection(
-        person_id=chosen.id,
-        source="auto",
-        slot="morning" if now.hour == 8 else "afternoon",
+    # Subject/body zgradimo pred insertom, da gre vse v en commit (en fsync)
+    subject, body = build_email_content(chosen, slot)
+    _insert_selection(
+        chosen.id, "auto", slot,
+        email_subject=subject, email_body=body,
     )
-    db.session.add(sel)
-    db.session.commit()
 
-    # Pošlji mail (če ga ima)
+    # Pošlji mail (če ga ima) — v backgroundu, da cron request ne visi na Gmailu
     if chosen.email:
-        subject, body = build_email_content(sel, sel.slot)
-        send_email(chosen.email, subject, body)
+        send_email_async(chosen.email, subject, body)
 
-    return True, f"Izbran {chosen.first_name} {chosen.last_name}"
+    return True, f"Izbran {chosen.display_name or chosen.first_name}"
+
+
+def _token_matches(supplied: str | None, expected: str | None) -> bool:
+    # compare_digest: primerjava v konstantnem času (brez timing side-channela);
+    # nad bajti, ker str varianta ob ne-ASCII vhodu vrže TypeError
+    return bool(expected) and hmac.compare_digest(
+        (supplied or "").encode(), expected.encode()
+    )
+
+
+def is_admin() -> bool:
+    """Ali request nosi veljaven ?admin= token; memoizirano na g, da se
+    args znotraj enega requesta preverijo samo enkrat."""
+    if not hasattr(g, "_is_admin"):
+        g._is_admin = _token_matches(request.args.get("admin"), ADMIN_TOKEN)
+    return g._is_admin
 
 
 # --------------------------------------------------
@@ -567,15 +880,16 @@ def run_auto_selection():
 @app.route("/run-auto")
 def run_auto():
     token = request.args.get("admin")
-    
-    # Najprej scheduler token
-    if token == SCHEDULER_TOKEN:
-        ok, msg = run_auto_selection()
-        return msg
 
-    # Tudi admin lahko ročno požene
-    if token == ADMIN_TOKEN:
-        ok, msg = run_auto_selection()
+    slot = request.args.get("slot")
+    if slot is None:
+        # stari cron URL-ji brez ?slot → slot izpeljemo iz ure klica
+        slot = "morning" if datetime.now().hour < 12 else "afternoon"
+
+    # Scheduler token ali admin (oba smeta ročno pognati žreb)
+    if _token_matches(token, SCHEDULER_TOKEN) or is_admin():
+        _refresh_gmail_token_if_needed()
+        ok, msg = run_auto_selection(slot)
         return msg
 
     abort(403)
@@ -603,44 +917,128 @@ def toggle_automation():
 # --------------------------------------------------
 @app.route("/random")
 def random_selection():
+    # Reject path je O(1): cachiran settings lookup + takojšen 409,
+    # brez DB dela
     if is_automation_enabled():
-        return {"error": "Avtomatika je vključena – ročna izbira ni dovoljena."}
+        return jsonify(error="Avtomatika je vključena – ročna izbira ni dovoljena."), 409
 
-    present_people = Person.query.filter_by(is_present=True, active=True).all()
-    if not present_people:
-        return {"error": "Ni prisotnih oseb."}
+    # Žreb iz in-process cacha prisotnih — brez SELECT-a na hot pathu,
+    # cache invalidirajo mutacije rosterja.
+    rows = _present_people()
+    if not rows:
+        return jsonify(error="Ni prisotnih oseb."), 404
 
-    person = random.choice(present_people)
+    person_id, person_name = random.choice(rows)
+    selection_id = _insert_selection(person_id, "manual", None)
 
-    sel = Selection(
-        person_id=person.id,
-        source="manual",
-        slot=None
+    return jsonify(
+        person_id=person_id,
+        person_name=person_name,
+        selection_id=selection_id,
     )
-    db.session.add(sel)
-    db.session.commit()
-
-    return {
-        "person_id": person.id,
-        "person_name": f"{person.first_name} {person.last_name or ''}".strip(),
-        "selection_id": sel.id
-    }
 
 
 # --------------------------------------------------
 # INDEX – PRIPRAVA PODATKOV ZA PRVO STRAN
 # --------------------------------------------------
+# Revizija vsebine za ETag: bumpa se ob VSAKI mutaciji, ki je DB skalarji v
+# _dashboard_etag ne zajamejo — preimenovanja, add/delete tipov kave, reset
+# statistike (MAX(id) ostane), Gmail connect/disconnect, email polja na
+# selectionih in presence flipi, ki se med sabo izničijo.
+import time as _time
+_PAGE_REV = [int(_time.time())]
+
+
+def _bump_page_rev():
+    _PAGE_REV[0] += 1
+
+
+def _dashboard_etag(auto_enabled: bool) -> str:
+    last_sel_id, n_people, n_present = db.session.execute(
+        db.select(
+            db.select(db.func.max(Selection.id)).scalar_subquery(),
+            db.select(db.func.count(Person.id)).where(Person.active.is_(True)).scalar_subquery(),
+            db.select(db.func.count(Person.id))
+            .where(Person.active.is_(True), Person.is_present.is_(True))
+            .scalar_subquery(),
+        )
+    ).one()
+    # Tudi časovno odvisni deli strani: next_auto_run se prevali točno ob
+    # 8:15/13:15 mejah, ordinal dneva pa opolnoči (days_since/weight/prob) —
+    # sicer bi odprt dashboard ob nespremenjenih vrsticah 304-al v nedogled.
+    next_run = compute_next_auto_run_dynamic()
+    return (
+        f"{last_sel_id or 0}-{n_people}-{n_present}-{int(auto_enabled)}"
+        f"-{_PAGE_REV[0]}-{next_run:%Y%m%d%H%M}-{date.today().toordinal()}"
+    )
+
+
 @app.route("/")
 def index():
     auto_enabled = get_setting("automation_enabled") == "1"
 
-    # People
-    people = Person.query.filter_by(active=True).order_by(Person.first_name).all()
-    present_count = Person.query.filter_by(active=True, is_present=True).count()
+    # Če se od zadnjega obiska ni nič spremenilo, preskočimo vse queryje +
+    # render. Ob čakajočih flash sporočilih 304 preskočimo — sicer bi jih
+    # obvestilo obtičalo v sessionu do naslednje spremembe podatkov.
+    etag = _dashboard_etag(auto_enabled)
+    if "_flashes" not in session and request.if_none_match.contains(etag):
+        return "", 304
+
+    # People (selectinload, da template ne sproži N+1 za default_coffee_type)
+    people = (
+        Person.query
+        .options(selectinload(Person.default_coffee_type), *_lazyload_guard())
+        .filter_by(active=True)
+        .order_by(Person.first_name)
+        .all()
+    )
+
+    coffee_types = _coffee_types_by_name()
+
+    # Dashboard skalarji v ENEM round-tripu (namesto 4 ločenih queryjev),
+    # objekti se nato naložijo po primary keyu (identity-map hit, če so že v sessionu).
+    best_person_sq = (
+        db.select(Selection.person_id)
+        .where(Selection.source == "auto")
+        .group_by(Selection.person_id)
+        .order_by(db.func.count(Selection.id).desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    favorite_coffee_sq = (
+        db.select(Person.default_coffee_type_id)
+        .where(Person.active.is_(True), Person.default_coffee_type_id.isnot(None))
+        .group_by(Person.default_coffee_type_id)
+        .order_by(db.func.count(Person.id).desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    last_selection_sq = db.select(db.func.max(Selection.id)).scalar_subquery()
+
+    best_person_id, favorite_coffee_id, last_selection_id = (
+        db.session.execute(
+            db.select(best_person_sq, favorite_coffee_sq, last_selection_sq)
+        ).one()
+    )
+
+    # people so že naloženi (in filtrirani na active) — štetje prisotnih
+    # ne rabi svojega subqueryja
+    present_count = sum(1 for p in people if p.is_present)
 
-    # Last selection
+    best_person = db.session.get(Person, best_person_id) if best_person_id else None
+    favorite_coffee = db.session.get(CoffeeType, favorite_coffee_id) if favorite_coffee_id else None
+    # TEXT stolpca s celim mailom dashboard ne rabi — defer ju pusti v bazi
     last_selection = (
-        Selection.query.order_by(Selection.selected_at.desc()).first()
+        db.session.get(
+            Selection,
+            last_selection_id,
+            options=[
+                joinedload(Selection.person),
+                defer(Selection.email_subject),
+                defer(Selection.email_body),
+            ],
+        )
+        if last_selection_id else None
     )
 
     # Next auto run
@@ -649,31 +1047,47 @@ def index():
     # Person stats
     try:
         person_stats = compute_person_stats() or []
-    except Exception as e:
-        print("STATS ERROR:", e)
+    except Exception:
+        logger.exception("STATS ERROR")
         person_stats = []
 
-    # ----- GRAF DATA -----
-    chart_labels = [s["name"] for s in person_stats]
-    chart_counts = [s["total"] for s in person_stats]
-    chart_days = [s["days_since"] for s in person_stats]
-    chart_weights = [s["weight"] for s in person_stats]
+    # ----- GRAF DATA (en prehod čez person_stats namesto štirih) -----
+    chart_labels, chart_counts, chart_days, chart_weights = [], [], [], []
+    for s in person_stats:
+        chart_labels.append(s["name"])
+        chart_counts.append(s["total"])
+        chart_days.append(s["days_since"])
+        chart_weights.append(s["weight"])
 
-    return render_template(
+    # base.html ima izris flashev trenutno izklopljen, zato jih template ne
+    # konzumira — queue ob polnem renderju spraznimo sami, da čakajoči flashi
+    # ne blokirajo 304 poti za vedno
+    session.pop("_flashes", None)
+
+    resp = make_response(render_template(
         "index.html",
         people=people,
+        coffee_types=coffee_types,
+        best_person=best_person,
+        favorite_coffee=favorite_coffee,
         last_selection=last_selection,
         present_count=present_count,
         auto_enabled=auto_enabled,
         next_auto_run=next_auto_run,
         automation_enabled=is_automation_enabled(),
+        is_admin=is_admin(),
         person_stats=person_stats,
 
         chart_labels=chart_labels,
         chart_counts=chart_counts,
         chart_days=chart_days,
         chart_weights=chart_weights,
-    )
+    ))
+    resp.set_etag(etag)
+    # no-cache = vedno revalidiraj (poceni 304), ampak nikoli ne servira
+    # stale strani — max-age bi po mutaciji skril flash sporočila
+    resp.cache_control.no_cache = True
+    return resp
 
 # --------------------------------------------------
 # PEOPLE – LIST + CRUD
@@ -681,20 +1095,24 @@ def index():
 @app.route("/people")
 def people_list():
     q = request.args.get("q", "").strip()
-    query = Person.query.order_by(Person.first_name)
+    query = (
+        Person.query
+        .options(selectinload(Person.default_coffee_type), *_lazyload_guard())
+        .order_by(Person.first_name)
+    )
 
     if q:
-        like = f"%{q}%"
-        query = query.filter(
-            or_(
-                Person.first_name.ilike(like),
-                Person.last_name.ilike(like),
-                Person.email.ilike(like),
-            )
+        # En lowercase haystack namesto treh OR ILIKE vej; coalesce, ker
+        # bi NULL last_name/email sicer izničil cel concat
+        haystack = db.func.lower(
+            Person.first_name
+            + " " + db.func.coalesce(Person.last_name, "")
+            + " " + db.func.coalesce(Person.email, "")
         )
+        query = query.filter(haystack.like(f"%{q.lower()}%"))
 
     people = query.all()
-    coffee_types = CoffeeType.query.order_by(CoffeeType.name).all()
+    coffee_types = _coffee_types_by_name()
 
     return render_template(
         "people.html",
@@ -715,6 +1133,7 @@ def people_add():
     p = Person(
         first_name=first,
         last_name=last,
+        display_name=f"{first} {last}".strip(),
         email=email,
         default_coffee_type_id=default_ct,
         is_present=is_present,
@@ -722,31 +1141,36 @@ def people_add():
     )
     db.session.add(p)
     db.session.commit()
+    _invalidate_present_cache()
     flash("Oseba dodana.", "success")
     return redirect(url_for("people_list"))
 
 
 @app.route("/people/edit/<int:person_id>", methods=["POST"])
 def people_edit(person_id):
-    p = Person.query.get_or_404(person_id)
+    p = db.get_or_404(Person, person_id)
 
     p.first_name = request.form.get("first_name") or p.first_name
     p.last_name = request.form.get("last_name") or ""
+    p.display_name = f"{p.first_name} {p.last_name}".strip()
     p.email = request.form.get("email") or None
     default_ct = request.form.get("default_coffee_type_id") or None
     p.default_coffee_type_id = default_ct
     p.is_present = bool(request.form.get("is_present"))
 
     db.session.commit()
+    _invalidate_present_cache()
+    _bump_page_rev()
     flash("Oseba posodobljena.", "success")
     return redirect(url_for("people_list"))
 
 
 @app.route("/people/delete/<int:person_id>", methods=["POST"])
 def people_delete(person_id):
-    p = Person.query.get_or_404(person_id)
+    p = db.get_or_404(Person, person_id)
     db.session.delete(p)
     db.session.commit()
+    _invalidate_present_cache()
     flash("Oseba izbrisana.", "info")
     return redirect(url_for("people_list"))
 
@@ -757,7 +1181,7 @@ def people_delete(person_id):
 @app.route("/coffee_types")
 @app.route("/coffee-types")
 def coffee_types_list():
-    coffee_types = CoffeeType.query.order_by(CoffeeType.name).all()
+    coffee_types = _coffee_types_by_name()
     return render_template("coffee_types.html", coffee_types=coffee_types)
 
 
@@ -769,25 +1193,28 @@ def coffee_types_add():
     ct = CoffeeType(name=name, icon=icon, active=True)
     db.session.add(ct)
     db.session.commit()
+    _bump_page_rev()
     flash("Tip kave dodan.", "success")
     return redirect(url_for("coffee_types_list"))
 
 
 @app.route("/coffee_types/edit/<int:ct_id>", methods=["POST"])
 def coffee_types_edit(ct_id):
-    ct = CoffeeType.query.get_or_404(ct_id)
+    ct = db.get_or_404(CoffeeType, ct_id)
     ct.name = request.form.get("name") or ct.name
     ct.icon = request.form.get("icon") or None
     db.session.commit()
+    _bump_page_rev()
     flash("Tip kave posodobljen.", "success")
     return redirect(url_for("coffee_types_list"))
 
 
 @app.route("/coffee_types/delete/<int:ct_id>", methods=["POST"])
 def coffee_types_delete(ct_id):
-    ct = CoffeeType.query.get_or_404(ct_id)
+    ct = db.get_or_404(CoffeeType, ct_id)
     db.session.delete(ct)
     db.session.commit()
+    _bump_page_rev()
     flash("Tip kave izbrisan.", "info")
     return redirect(url_for("coffee_types_list"))
 
@@ -797,9 +1224,9 @@ def coffee_types_delete(ct_id):
 # --------------------------------------------------
 @app.route("/email-preview/<int:selection_id>")
 def email_preview(selection_id):
-    sel = Selection.query.get_or_404(selection_id)
+    sel = db.get_or_404(Selection, selection_id, options=[joinedload(Selection.person)])
     slot = request.args.get("slot", "morning")
-    subject, body = build_email_content(sel, slot)
+    subject, body = build_email_content(sel.person, slot)
     return jsonify({"subject": subject, "body": body})
 
 
@@ -808,21 +1235,22 @@ def email_preview(selection_id):
 # --------------------------------------------------
 @app.route("/send-email-now/<int:selection_id>")
 def send_email_now(selection_id):
-    sel = Selection.query.get_or_404(selection_id)
+    sel = db.get_or_404(Selection, selection_id, options=[joinedload(Selection.person)])
 
     if not sel.person.email:
         flash("Oseba nima email naslova — pošiljanje ni možno.", "danger")
         return redirect(url_for("index"))
 
     slot = request.args.get("slot", "manual")
-    subject, body = build_email_content(sel, slot)
-
-    send_email(sel.person.email, subject, body)
+    subject, body = build_email_content(sel.person, slot)
 
     sel.email_subject = subject
     sel.email_body = body
     sel.slot = slot
     db.session.commit()
+    _bump_page_rev()
+
+    send_email_async(sel.person.email, subject, body)
 
     flash("Email poslan (če je Gmail pravilno povezan).", "success")
     return redirect(url_for("index"))
@@ -830,7 +1258,7 @@ def send_email_now(selection_id):
 
 @app.route("/send-email-custom/<int:selection_id>", methods=["POST"])
 def send_email_custom(selection_id):
-    sel = Selection.query.get_or_404(selection_id)
+    sel = db.get_or_404(Selection, selection_id, options=[joinedload(Selection.person)])
 
     if not sel.person.email:
         flash("Oseba nima email naslova — pošiljanje ni možno.", "danger")
@@ -844,12 +1272,13 @@ def send_email_custom(selection_id):
         flash("Subject in vsebina emaila ne smeta biti prazna.", "danger")
         return redirect(url_for("index"))
 
-    send_email(sel.person.email, subject, body)
-
     sel.email_subject = subject
     sel.email_body = body
     sel.slot = slot
     db.session.commit()
+    _bump_page_rev()
+
+    send_email_async(sel.person.email, subject, body)
 
     flash("Prilagojen email je bil poslan.", "success")
     return redirect(url_for("index"))
@@ -860,8 +1289,12 @@ def send_email_custom(selection_id):
 # --------------------------------------------------
 @app.route("/reset-statistics", methods=["POST"])
 def stats_reset():
-    Selection.query.filter_by(source="auto").delete()
+    # Core DELETE — brez session-sync evalvacije nad naloženimi objekti
+    db.session.execute(db.delete(Selection).where(Selection.source == "auto"))
     db.session.commit()
+    # MAX(selections.id) se ob brisanju starih vrstic ne spremeni — brez
+    # bumpa bi dashboard po resetu serviral stale 304
+    _bump_page_rev()
     flash("Statistika avtomatskega izbiranja je resetirana.", "info")
     return redirect(url_for("index"))
 
@@ -869,11 +1302,55 @@ def stats_reset():
 # --------------------------------------------------
 # PRISOTNOST OSEB
 # --------------------------------------------------
+@app.route("/presence/bulk", methods=["POST"])
+def presence_bulk():
+    """Sprejme JSON {person_id: bool} in vse prisotnosti posodobi v enem UPDATE.
+
+    Frontend lahko debounca kljukice in pošlje en request namesto N
+    zaporednih POST → commit ciklov.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Pričakujem JSON objekt {person_id: bool}."}), 400
+
+    try:
+        updates = {int(pid): bool(val) for pid, val in payload.items()}
+    except (TypeError, ValueError):
+        return jsonify({"error": "Neveljavni person_id ključi."}), 400
+
+    if not updates:
+        return jsonify({"updated": 0})
+
+    result = db.session.execute(
+        db.update(Person)
+        .where(Person.id.in_(updates))
+        .values(is_present=db.case(updates, value=Person.id))
+    )
+    db.session.commit()
+    _invalidate_present_cache()
+    # flipi, ki se izničijo, pustijo count prisotnih enak — ETag skalarji
+    # jih ne vidijo
+    _bump_page_rev()
+
+    return jsonify({"updated": result.rowcount})
+
+
 @app.route("/toggle_presence/<int:person_id>", methods=["POST"])
 def toggle_presence(person_id):
-    p = Person.query.get_or_404(person_id)
-    p.is_present = bool(request.form.get("is_present"))
+    # Direkten UPDATE — brez SELECT + flush para za flip enega boolean-a
+    updated = db.session.execute(
+        db.update(Person)
+        .where(Person.id == person_id)
+        .values(is_present=bool(request.form.get("is_present")))
+    ).rowcount
     db.session.commit()
+    _invalidate_present_cache()
+    # enak hole kot pri presence_bulk: dva nasprotna flipa pustita count
+    # prisotnih enak, ETag skalarji spremembe ne vidijo
+    _bump_page_rev()
+
+    if not updated:
+        abort(404)
     return redirect(request.referrer or url_for("index"))
 
 